@@ -1,10 +1,12 @@
 import unittest
+import json
 import ast
-from code_analyzer import CodeAnalyzer  # Assuming your class is in code_analyzer.py
 import sys
 import os
+import tempfile
+from unittest import mock
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from twenty_percent.code_analyzer import CodeAnalyzer
+from twenty_percent.code_crawler import CACHE_VERSION, CodeAnalyzer
 
 class TestCodeAnalyzer(unittest.TestCase):
 
@@ -12,7 +14,8 @@ class TestCodeAnalyzer(unittest.TestCase):
         """Set up for test methods."""
         self.repo_path = "/dummy/repo/path"  # Dummy path, not actually used in these tests
         self.repo_name = "test_repo"
-        self.analyzer = CodeAnalyzer(self.repo_path, self.repo_name)
+        self.output_file_path = "/dummy/output/path"  # Dummy path, not actually used in these tests
+        self.analyzer = CodeAnalyzer(self.repo_path, self.repo_name, self.output_file_path)
 
     def _get_function_node_and_source(self, code_string, function_name="test_function"):
         """Helper function to parse code and get a FunctionDef node."""
@@ -22,6 +25,13 @@ class TestCodeAnalyzer(unittest.TestCase):
                 return node, code_string  # Return node and original source
         self.fail(f"Function '{function_name}' not found in code string.")  # Fail if function not found
 
+    def _write_module(self, tmp_dir, code):
+        """Helper function to write code to a module in tmp_dir, returning its path."""
+        filepath = os.path.join(tmp_dir, "module.py")
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write(code)
+        return filepath
+
     def test_analyze_function_basic(self):
         """Test analyze_function with a basic function."""
         code = """
@@ -31,10 +41,7 @@ def test_function(arg1, arg2):
     return variable1
 """
         function_node, source = self._get_function_node_and_source(code)
-        self.analyzer.analyze_function(function_node, "test_file.py", source)
-        self.assertEqual(len(self.analyzer.dataset), 1)
-        function_data = self.analyzer.dataset[0]
-
+        function_data = self.analyzer.analyze_function(function_node, "test_file.py", source)
         self.assertEqual(function_data['function_name'], 'test_function')
         self.assertEqual(function_data['docstring'], "Basic function docstring.")
         self.assertEqual(function_data['variables'], ['arg1', 'arg2', 'variable1'])
@@ -53,10 +60,10 @@ def test_function(arg1):
     return variable2
 """
         function_node, source = self._get_function_node_and_source(code)
-        self.analyzer.analyze_function(function_node, "another_file.py", source)
-        self.assertEqual(self.analyzer.dataset[1]['function_name'], 'test_function') #dataset index 1 now
-        self.assertIsNone(self.analyzer.dataset[1]['docstring'])
-        self.assertEqual(self.analyzer.dataset[1]['variables'], ['arg1', 'variable2'])
+        function_data = self.analyzer.analyze_function(function_node, "another_file.py", source)
+        self.assertEqual(function_data['function_name'], 'test_function')
+        self.assertIsNone(function_data['docstring'])
+        self.assertEqual(function_data['variables'], ['arg1', 'variable2'])
 
 
 
@@ -72,9 +79,9 @@ def test_function(data):
     return value
 """
         function_node, source = self._get_function_node_and_source(code)
-        self.analyzer.analyze_function(function_node, "complex_file.py", source)
-        self.assertEqual(self.analyzer.dataset[2]['function_name'], 'test_function') #dataset index 2 now
-        self.assertEqual(self.analyzer.dataset[2]['variables'], ['data', 'results', 'x', 'value', 'e']) # 'e' for exception handler
+        function_data = self.analyzer.analyze_function(function_node, "complex_file.py", source)
+        self.assertEqual(function_data['function_name'], 'test_function')
+        self.assertEqual(function_data['variables'], ['data', 'results', 'x', 'value', 'e']) # 'e' for exception handler
 
 
     def test_analyze_function_kwargs_varargs(self):
@@ -85,10 +92,52 @@ def test_function(arg1, *args, kw_only, **kwargs):
     return z
 """
         function_node, source = self._get_function_node_and_source(code)
-        self.analyzer.analyze_function(function_node, "args_file.py", source)
-        self.assertEqual(self.analyzer.dataset[3]['function_name'], 'test_function') #dataset index 3 now
-        self.assertEqual(self.analyzer.dataset[3]['variables'], ['arg1', 'args', 'kw_only', 'kwargs', 'z'])
+        function_data = self.analyzer.analyze_function(function_node, "args_file.py", source)
+        self.assertEqual(function_data['function_name'], 'test_function')
+        self.assertEqual(function_data['variables'], ['arg1', 'args', 'kw_only', 'kwargs', 'z'])
+
+
+
+    def test_analyze_function_nested_function(self):
+        """Test analyze_function keeps a nested function's variables out of the outer function."""
+        code = """
+def test_function(items):
+    total = 0
+    def helper(item):
+        doubled = item * 2
+        return doubled
+    for item in items:
+        total += helper(item)
+    return total
+"""
+        function_node, source = self._get_function_node_and_source(code)
+        function_data = self.analyzer.analyze_function(function_node, "nested_file.py", source)
+        self.assertEqual(function_data['variables'], ['items', 'total', 'item'])
+
 
+    def test_analyze_function_nested_scopes(self):
+        """Test analyze_function skips names bound inside nested classes, async functions and lambdas.
+
+        Decorators, argument defaults and class bases are evaluated in the enclosing scope, so
+        the names they bind belong to the outer function, not to the nested definition.
+        """
+        code = """
+def test_function(values):
+    class Holder(base := object):
+        attribute = 1
+    async def fetch(url):
+        response = await url
+    @deco(decorated := 1)
+    def helper(a=(default := 2), *, b=(keyword := 3)):
+        pass
+    key = lambda value, default=(fallback := 0): (inner := value)
+    return Holder, fetch, helper, key
+"""
+        function_node, source = self._get_function_node_and_source(code)
+        function_data = self.analyzer.analyze_function(function_node, "scopes_file.py", source)
+        self.assertEqual(
+            function_data['variables'], ['values', 'base', 'decorated', 'default', 'keyword', 'key', 'fallback']
+        )
 
 
     def test_analyze_function_code_extraction_indentation(self):
@@ -107,7 +156,7 @@ def test_function(value):
 
 """
         function_node, source = self._get_function_node_and_source(code)
-        self.analyzer.analyze_function(function_node, "indent_file.py", source)
+        function_data = self.analyzer.analyze_function(function_node, "indent_file.py", source)
         expected_code_chunk = """def test_function(value):
     # A comment line before
     if value > 10:
@@ -116,14 +165,97 @@ def test_function(value):
     else:
         result = value / 2
     # Comment after the if/else
-    return result # Inline comment"""
-        self.assertEqual(self.analyzer.dataset[4]['code_chunk'].strip(), expected_code_chunk.strip()) #dataset index 4 now
 
+    return result"""
+        self.assertEqual(function_data['code_chunk'].strip(), expected_code_chunk.strip())
+
+
+    def test_analyze_file_keeps_docstrings(self):
+        """Test analyze_file finds every function in a file and keeps their docstrings."""
+        code = """
+def outer():
+    \"\"\"Outer docstring.\"\"\"
+    def inner():
+        \"\"\"Inner docstring.\"\"\"
+        return 1
+    return inner
+"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = self._write_module(tmp_dir, code)
+            dataset = self.analyzer.analyze_file(filepath)
+        self.assertEqual([d['function_name'] for d in dataset], ['outer', 'inner'])
+        self.assertEqual([d['docstring'] for d in dataset], ["Outer docstring.", "Inner docstring."])
+
+
+    def test_analyze_file_top_level_await(self):
+        """Test analyze_file allows top-level await, so the functions of such a file are still found."""
+        code = """
+def test_function(url):
+    response = url
+    return response
+
+result = await test_function("https://example.com")
+"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = self._write_module(tmp_dir, code)
+            with mock.patch("twenty_percent.code_crawler.compile", create=True, wraps=compile) as compile_mock:
+                dataset = self.analyzer.analyze_file(filepath)
+        self.assertTrue(compile_mock.call_args.kwargs["flags"] & ast.PyCF_ALLOW_TOP_LEVEL_AWAIT)
+        self.assertEqual([d['variables'] for d in dataset], [['url', 'response']])
+
+
+    def test_save_dataset_lone_surrogate(self):
+        """Test save_dataset writes strings that are not valid UTF-8 as escapes instead of failing."""
+        code = """
+def test_function():
+    \"\"\"Half a pair: \\ud800\"\"\"
+"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = self._write_module(tmp_dir, code)
+            analyzer = CodeAnalyzer(tmp_dir, self.repo_name, tmp_dir)
+            analyzer.save_dataset(analyzer.analyze_file(filepath))
+            with open(os.path.join(tmp_dir, f"{self.repo_name}_code_dataset.jsonl"), "rb") as f:
+                lines = f.read().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['docstring'], "Half a pair: \ud800")
+
+
+    def test_analyze_repo_cache_version(self):
+        """Test analyze_repo reuses its cache, but not one written by a different cache version."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = self._write_module(tmp_dir, "def test_function():\n    value = 1\n")
+            analyzer = CodeAnalyzer(tmp_dir, self.repo_name, tmp_dir, max_workers=1)
+            st = os.stat(filepath)
+            stale = {"function_name": "stale", "variables": [], "repo_name": self.repo_name, "filepath": filepath}
+            cache_filename = os.path.join(tmp_dir, f"{self.repo_name}_code_dataset.cache.jsonl")
+            dataset_filename = os.path.join(tmp_dir, f"{self.repo_name}_code_dataset.jsonl")
+            function_names = []
+            for version in (CACHE_VERSION, CACHE_VERSION - 1):
+                with open(cache_filename, "w", encoding="utf-8") as f:
+                    f.write(json.dumps({"version": version, "python": list(sys.version_info[:2])}) + "\n")
+                    f.write(json.dumps({"filepath": filepath, "key": [st.st_mtime_ns, st.st_size], "functions": [stale]}) + "\n")
+                analyzer.analyze_repo()
+                with open(dataset_filename, encoding="utf-8") as f:
+                    function_names.append([json.loads(line)['function_name'] for line in f])
+        self.assertEqual(function_names, [['stale'], ['test_function']])
 
-    def tearDown(self):
-        """Clean up after test methods - reset dataset."""
-        self.analyzer.dataset = [] # Important to reset dataset for each test run
 
+    def test_analyze_repo_retries_failed_files(self):
+        """Test analyze_repo does not cache a file that failed to parse, so it is analyzed again."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = self._write_module(tmp_dir, "def test_function(:\n    pass\n")
+            analyzer = CodeAnalyzer(tmp_dir, self.repo_name, tmp_dir, max_workers=1)
+            dataset_filename = os.path.join(tmp_dir, f"{self.repo_name}_code_dataset.jsonl")
+            function_names = []
+            for code in (None, "def test_function():\n   pass\n"):
+                if code is not None:  # Fixed without changing the modification time or size
+                    st = os.stat(filepath)
+                    self._write_module(tmp_dir, code)
+                    os.utime(filepath, ns=(st.st_atime_ns, st.st_mtime_ns))
+                analyzer.analyze_repo()
+                with open(dataset_filename, encoding="utf-8") as f:
+                    function_names.append([json.loads(line)['function_name'] for line in f])
+        self.assertEqual(function_names, [[], ['test_function']])
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,120 @@
+import unittest
+import json
+import sys
+import os
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    from twenty_percent import get_git_2
+except ImportError:  # get_git_2 needs requests, which is not installed with the project
+    get_git_2 = None
+
+REPOS = [
+    {"name": "python_repo", "clone_url": "https://github.com/ONSdigital/python_repo.git", "size": 10, "language": "Python"},
+    {"name": "r_repo", "clone_url": "https://github.com/ONSdigital/r_repo.git", "size": 20, "language": "R"},
+]
+
+
+def fake_response(status_code, repos=None, headers=None):
+    """Builds a stand-in for a requests.Response from the GitHub API."""
+    response = mock.Mock(status_code=status_code, headers=headers or {})
+    response.json.return_value = repos
+    return response
+
+
+@unittest.skipIf(get_git_2 is None, "requests is not installed")
+class TestGetOnsRepos(unittest.TestCase):
+
+    def _get_ons_repos(self, tmp_dir, responses):
+        """Runs get_ons_repos against the given responses, returning the repos found and the get calls made."""
+        with mock.patch.object(get_git_2.requests, "Session") as session_class, \
+                mock.patch.object(get_git_2.time, "sleep") as sleep:
+            session_class.return_value.get.side_effect = responses
+            repos_info = get_git_2.get_ons_repos(
+                output_file=os.path.join(tmp_dir, "repos.txt"),
+                etag_cache_file=os.path.join(tmp_dir, "etag_cache.json"),
+            )
+        sleep.assert_not_called()
+        return repos_info, session_class.return_value.get.call_args_list
+
+    def test_get_ons_repos_etag_cache(self):
+        """Test get_ons_repos sends the saved ETag and reuses the cached page when GitHub answers 304."""
+        expected = [{"name": "python_repo", "url": "https://github.com/ONSdigital/python_repo.git", "size": 10}]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            first_run = self._get_ons_repos(tmp_dir, [
+                fake_response(200, REPOS, {"ETag": '"page-1"'}),
+                fake_response(200, []),  # The last page has no ETag, so it is not cached
+            ])
+            with open(os.path.join(tmp_dir, "etag_cache.json"), encoding="utf-8") as f:
+                etag_cache = json.load(f)
+            second_run = self._get_ons_repos(tmp_dir, [fake_response(304), fake_response(200, [])])
+        self.assertEqual(list(etag_cache), ["1:100"])
+        self.assertEqual(etag_cache["1:100"]["etag"], '"page-1"')
+        self.assertEqual(first_run[0], expected)
+        self.assertEqual(second_run[0], expected)
+        self.assertEqual([call.kwargs["headers"] for call in first_run[1]], [{}, {}])
+        self.assertEqual([call.kwargs["headers"] for call in second_run[1]], [{"If-None-Match": '"page-1"'}, {}])
+        self.assertTrue(all(call.kwargs["timeout"] == get_git_2.REQUEST_TIMEOUT for call in first_run[1] + second_run[1]))
+
+    def test_wait_for_rate_limit(self):
+        """Test _wait_for_rate_limit sleeps until the reset time only once no requests remain."""
+        with mock.patch.object(get_git_2.time, "time", return_value=1000.0), \
+                mock.patch.object(get_git_2.time, "sleep") as sleep:
+            get_git_2._wait_for_rate_limit(fake_response(200, headers={"X-RateLimit-Remaining": "1"}))
+            sleep.assert_not_called()
+            get_git_2._wait_for_rate_limit(
+                fake_response(200, headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "1010"})
+            )
+        sleep.assert_called_once_with(11.0)
+
+
+@unittest.skipIf(get_git_2 is None, "requests is not installed")
+class TestBatchCloneRepos(unittest.TestCase):
+
+    def test_batch_clone_repos(self):
+        """Test batch_clone_repos shallow clones each repo not yet cloned, and survives failed and stalled clones."""
+        repos_info = [
+            {"name": "cloned", "url": "https://github.com/ONSdigital/cloned.git"},
+            {"name": "failed", "url": "https://github.com/ONSdigital/failed.git"},
+            {"name": "stalled", "url": "https://github.com/ONSdigital/stalled.git"},
+            {"name": "existing", "url": "https://github.com/ONSdigital/existing.git"},
+        ]
+
+        def fake_run(argv, **kwargs):
+            """Clones like git would, failing or hanging for the repos named so."""
+            target_dir = argv[-1]
+            os.makedirs(target_dir)
+            if target_dir.endswith("failed"):
+                os.rmdir(target_dir)  # git cleans up after a failed clone itself
+                return mock.Mock(returncode=128, stderr="fatal: repository not found\n")
+            if target_dir.endswith("stalled"):
+                raise get_git_2.subprocess.TimeoutExpired(argv, kwargs["timeout"])
+            return mock.Mock(returncode=0, stderr="")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.makedirs(os.path.join(tmp_dir, "existing"))
+            with mock.patch.object(get_git_2.subprocess, "run", side_effect=fake_run) as run, \
+                    redirect_stdout(StringIO()) as output:
+                get_git_2.batch_clone_repos(repos_info, clone_dir=tmp_dir, max_workers=1)
+            cloned = sorted(os.listdir(tmp_dir))
+        self.assertEqual(
+            [call.args[0] for call in run.call_args_list],
+            [
+                ["git", "clone", "--depth=1", "--filter=blob:none", repo["url"], os.path.join(tmp_dir, repo["name"])]
+                for repo in repos_info[:3]
+            ],
+        )
+        self.assertTrue(all(call.kwargs["timeout"] == get_git_2.CLONE_TIMEOUT for call in run.call_args_list))
+        self.assertEqual(cloned, ["cloned", "existing"])  # The stalled clone's partial directory is removed
+        errors = [line for line in output.getvalue().splitlines() if line.startswith("Error cloning")]
+        self.assertEqual(errors, [
+            "Error cloning failed. Result Code 128: fatal: repository not found",
+            f"Error cloning stalled: timed out after {get_git_2.CLONE_TIMEOUT}s",
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import json
+import sys
+import os
+import tempfile
+from unittest import mock
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    from twenty_percent import qu_generator
+except ImportError:  # qu_generator needs requests, which is not installed with the project
+    qu_generator = None
+
+CODE_DATA = [
+    {"repo_name": "test_repo", "filepath": "first.py", "function_name": "first_function", "code_chunk": "def first_function(a, b):\n    c = a + b",
+     "variables": ["a", "b", "c"], "docstring": "First docstring."},
+    {"repo_name": "test_repo", "filepath": "second.py", "function_name": "second_function", "code_chunk": "def second_function(x):\n    y = x",
+     "variables": ["x", "y"], "docstring": None},
+]
+
+
+def fake_ollama_response(prompt):
+    """Answers with the question from the prompt, or fails like Ollama would for edge case questions."""
+    question = prompt.rsplit("\nQuestion: ", 1)[1].removesuffix("\nAnswer:\n")
+    if "edge cases" in question:
+        return None
+    return "Answer to: " + question
+
+
+@unittest.skipIf(qu_generator is None, "requests is not installed")
+class TestProcessQAData(unittest.TestCase):
+
+    def _process_qa_data(self, batch_size):
+        """Runs process_qa_data over CODE_DATA with Ollama stubbed out, returning the Q&A pairs written."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file = os.path.join(tmp_dir, "code_dataset.jsonl")
+            output_file = os.path.join(tmp_dir, "qa_data_with_answers.jsonl")
+            with open(input_file, "w", encoding="utf-8") as f:
+                for item in CODE_DATA:
+                    f.write(json.dumps(item) + "\n")
+            with mock.patch.object(qu_generator, "get_ollama_response", side_effect=fake_ollama_response), \
+                    mock.patch.object(qu_generator, "BATCH_SIZE", batch_size):
+                qu_generator.process_qa_data(input_file, output_file)
+            with open(output_file, encoding="utf-8") as f:
+                return [json.loads(line) for line in f]
+
+    def test_process_qa_data_routes_answers(self):
+        """Test each answer lands on its own question, failed ones are skipped, at any batch size."""
+        expected = []
+        for qa_pair in qu_generator.generate_qa_pairs(CODE_DATA):
+            if qa_pair['answer'] == qu_generator.PLACEHOLDER:
+                if "edge cases" in qa_pair['question']:
+                    continue  # Skipped, as Ollama gave no answer
+                qa_pair['answer'] = "Answer to: " + qa_pair['question']
+            expected.append(qa_pair)
+        self.assertEqual(len(expected), 27)  # 29 pairs, less one failed answer per function
+
+        for batch_size in (1, 4, 7, 64):  # 29 pairs do not divide evenly into any of these
+            with self.subTest(batch_size=batch_size):
+                self.assertEqual(self._process_qa_data(batch_size), expected)
+
+    def test_get_ollama_response_timeout(self):
+        """Test get_ollama_response gives up on a hung generation and returns None, like other errors."""
+        with mock.patch.object(qu_generator.SESSION, "post", side_effect=qu_generator.requests.Timeout) as post:
+            self.assertIsNone(qu_generator.get_ollama_response("prompt"))
+        self.assertEqual(post.call_args.kwargs["timeout"], qu_generator.OLLAMA_TIMEOUT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+"""JSON Lines helpers shared by the code crawler and the Q&A generators."""
+
+import json
+from collections.abc import Iterator
+from typing import Any
+
+try:
+    import orjson  # Much faster serializer, used when installed
+except ImportError:
+    _HAS_ORJSON = False
+else:
+    _HAS_ORJSON = True
+
+
+def dumps(obj: Any) -> bytes:
+    """Serializes obj to compact JSON bytes, with orjson when it is installed.
+
+    orjson rejects strings that cannot be encoded as UTF-8, such as a lone surrogate from a
+    docstring escape or from a file name os.scandir could not decode. Records holding one are
+    serialized with the standard library instead, which writes it as an escape sequence.
+
+    Args:
+        obj: The JSON-serializable object.
+
+    Returns:
+        The serialized object, without a trailing newline.
+    """
+    if _HAS_ORJSON:
+        try:
+            data: bytes = orjson.dumps(obj)
+            return data
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(obj, separators=(",", ":")).encode("ascii")
+
+
+def load_code_data(jsonl_file_path: str) -> Iterator[dict[str, Any]]:
+    """Loads the code analysis data written by the code crawler.
+
+    Args:
+        jsonl_file_path: The path of a JSON Lines file with one code chunk per line.
+
+    Yields:
+        One dictionary per code chunk, read a line at a time so the whole
+        dataset is never held in memory.
+    """
+    with open(jsonl_file_path, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
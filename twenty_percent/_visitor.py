@@ -0,0 +1,117 @@
+"""The AST visitor that collects the names bound in a function's scope.
+
+This is the innermost loop of the code crawler, so it is kept in its own strictly typed
+module that mypyc can compile to a C extension (see ``make build-visitor``). When the
+extension is built it is imported in place of this file; otherwise this file is used as
+plain Python, with identical results. Once built, the extension keeps being imported after
+this file is edited: rebuild it, or remove it with ``make clean``, to pick up the change.
+"""
+
+import ast
+from collections.abc import Callable, MutableSequence
+
+
+def _h_name(node: ast.Name, out: dict[str, None]) -> None:
+    if type(node.ctx) is ast.Store:
+        out[node.id] = None
+
+
+def _h_except(node: ast.ExceptHandler, out: dict[str, None]) -> None:
+    if node.name is not None:
+        out[node.name] = None
+
+
+# Handlers are looked up on the exact node type, which is cheaper than an isinstance ladder;
+# none of these node classes are subclassed by the parser. Comprehension targets need no
+# handler of their own: they are Store names, and comprehensions are descended into.
+_VISIT: dict[type, Callable[..., None]] = {
+    ast.Name: _h_name,
+    ast.ExceptHandler: _h_except,
+}
+
+# Leaf nodes that can never bind a name, so they are not worth pushing onto the stack.
+_LEAVES: frozenset[type] = frozenset(
+    {ast.Constant, ast.Load, ast.Store, ast.Del, ast.alias, ast.Pass, ast.Break, ast.Continue}
+    | {cls for base in (ast.operator, ast.unaryop, ast.cmpop, ast.boolop) for cls in base.__subclasses__()}
+)
+
+# Definitions whose bodies are separate scopes, walked on their own rather than as part of
+# the enclosing function. Only FunctionDef scopes are emitted to the dataset.
+_SCOPES: frozenset[type] = frozenset({ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef})
+
+
+def _push_children(node: ast.AST, stack: list[ast.AST]) -> None:
+    """Pushes the child nodes of node onto stack in reverse, so they are popped in source order.
+
+    Equivalent to ast.iter_child_nodes, but without the generator, and skipping leaves.
+    """
+    fields = node._fields
+    for i in range(len(fields) - 1, -1, -1):
+        value = getattr(node, fields[i], None)
+        if isinstance(value, list):
+            for j in range(len(value) - 1, -1, -1):
+                item = value[j]
+                if isinstance(item, ast.AST) and type(item) not in _LEAVES:
+                    stack.append(item)
+        elif isinstance(value, ast.AST) and type(value) not in _LEAVES:
+            stack.append(value)
+
+
+def _push_enclosing(node: ast.AST, stack: list[ast.AST]) -> None:
+    """Pushes the parts of a nested definition that are evaluated in the enclosing scope.
+
+    These are its decorators, its argument defaults, and a class's bases and keywords. The
+    definition's own scope is only its body and argument names, so they are not walked there.
+    """
+    parts: list[ast.AST] = []
+    parts.extend(node.decorator_list)  # type: ignore[attr-defined]
+    if type(node) is ast.ClassDef:
+        parts.extend(node.bases)
+        parts.extend(node.keywords)
+    else:
+        args: ast.arguments = node.args  # type: ignore[attr-defined]
+        parts.extend(args.defaults)
+        for default in args.kw_defaults:
+            if default is not None:  # None for a keyword-only argument without a default
+                parts.append(default)
+    for i in range(len(parts) - 1, -1, -1):
+        stack.append(parts[i])
+
+
+def collect(node: ast.AST, out: dict[str, None], nested: MutableSequence[ast.AST]) -> None:
+    """Collects the names bound in node's own scope into out, visiting each node once.
+
+    Nested function, async function and class definitions have scopes of their own, so
+    they are appended to nested rather than descended into; each is walked exactly once,
+    as its own scope. Their decorators, argument defaults and class bases are evaluated in
+    this scope, though, so they are walked here. When node is itself a function or class,
+    only its body is walked. A lambda's body is skipped outright, since nothing in it binds a
+    name in this scope or defines a function. Uses an explicit stack rather than
+    recursion or ast.walk.
+
+    Args:
+        node: The module, function or class whose scope is collected.
+        out: An insertion-ordered set of names, added to in source order.
+        nested: Receives the definitions nested directly inside node's scope.
+    """
+    stack: list[ast.AST] = []
+    if type(node) in _SCOPES:
+        body: list[ast.stmt] = node.body  # type: ignore[attr-defined]
+        for i in range(len(body) - 1, -1, -1):
+            stack.append(body[i])
+    else:
+        _push_children(node, stack)
+    while stack:
+        child = stack.pop()
+        child_type = type(child)
+        if child_type in _SCOPES:
+            nested.append(child)
+            _push_enclosing(child, stack)
+            continue
+        if child_type is ast.Lambda:
+            stack.append(child.args)  # type: ignore[attr-defined]  # Defaults are evaluated in the enclosing scope
+            continue
+        handler = _VISIT.get(child_type)
+        if handler is not None:
+            handler(child, out)
+        _push_children(child, stack)
@@ -1,39 +1,89 @@
 import requests
 import json
 import os
+import shutil
+import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from typing import Any
 
-def get_ons_repos(output_file="ons_repos.txt", max_repos=10):
+REPO_FIELDS = ("name", "clone_url", "size", "language")  # The fields kept in the ETag cache
+REQUEST_TIMEOUT = 30  # Seconds to wait for the GitHub API before giving up on a page
+CLONE_TIMEOUT = 600  # Seconds to wait for a git clone before giving up on the repository
+
+
+def _load_etag_cache(etag_cache_file: str) -> dict[str, Any]:
+    """Loads the ETags and repository pages saved by a previous run."""
+    try:
+        with open(etag_cache_file) as f:
+            etag_cache: dict[str, Any] = json.load(f)
+            return etag_cache
+    except (OSError, ValueError):  # No usable cache yet, so every page is fetched in full
+        return {}
+
+
+def _wait_for_rate_limit(response: requests.Response) -> None:
+    """Sleeps until the GitHub rate limit resets, if the last response used up the remaining requests."""
+    if response.headers.get("X-RateLimit-Remaining") == "0":
+        reset = int(response.headers.get("X-RateLimit-Reset", time.time()))
+        delay = max(reset - time.time(), 0) + 1
+        print(f"GitHub API rate limit reached. Waiting {delay:.0f}s for it to reset.")
+        time.sleep(delay)
+
+
+def get_ons_repos(output_file="ons_repos.txt", max_repos=10, etag_cache_file="etag_cache.json"):
     """
     Retrieves a list of public Python repositories from the ONSdigital GitHub
     organization, along with their sizes, and saves the information to a file.
     Stops after finding a maximum of 'max_repos' Python repositories.
     Writes repository information to the file as soon as it's found.
 
+    Each page's ETag is saved to 'etag_cache_file', and later runs send it back
+    with If-None-Match. GitHub answers 304 Not Modified for unchanged pages, which
+    does not count against the rate limit, and the cached page is used instead.
+
     Args:
         output_file: The name of the file to save the repository information to.
         max_repos: The maximum number of Python repositories to retrieve.
+        etag_cache_file: The name of the file to cache page ETags and contents in.
     """
 
     url = "https://api.github.com/users/ONSdigital/repos"
     page = 1
-    per_page = 10  # Maximum allowed by GitHub API is 100
+    per_page = 100  # Maximum allowed by GitHub API is 100
     python_repos_count = 0 # Counter for Python repos found
     repos_info = [] # Keep this if you still need to return the list
 
+    session = requests.Session()  # Reuses the connection to the GitHub API across pages
+    session.headers["Accept"] = "application/vnd.github+json"
+    etag_cache = _load_etag_cache(etag_cache_file)
+
     with open(output_file, "w") as f: # Open file once for writing
         while True:
             if python_repos_count >= max_repos:
                 print(f"Reached maximum number of Python repositories ({max_repos}). Stopping.")
                 break # Stop if we have found enough Python repos
 
-            time.sleep(1.3) # Keep the delay
-
             params = {"page": page, "per_page": per_page}
-            response = requests.get(url, params=params)
-            response.raise_for_status()  # Raise an exception for bad status codes
+            cache_key = f"{page}:{per_page}"
+            cached = etag_cache.get(cache_key)
+            headers = {"If-None-Match": cached["etag"]} if cached else {}
+            response = session.get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+
+            if response.status_code == HTTPStatus.NOT_MODIFIED:  # Page unchanged since the last run
+                repos = cached["repos"]
+            else:
+                response.raise_for_status()  # Raise an exception for bad status codes
+                repos = response.json()
+                if "ETag" in response.headers:
+                    etag_cache[cache_key] = {
+                        "etag": response.headers["ETag"],
+                        "repos": [{field: repo[field] for field in REPO_FIELDS} for repo in repos],
+                    }
 
-            repos = response.json()
+            _wait_for_rate_limit(response)
             if not repos:
                 print("No more repositories found on GitHub API page. Exiting.")
                 break  # No more repositories from GitHub API
@@ -62,40 +112,59 @@ def get_ons_repos(output_file="ons_repos.txt", max_repos=10):
 
             page += 1
 
+    with open(etag_cache_file, "w") as f:
+        json.dump(etag_cache, f)
+
     print(f"Retrieved information for {python_repos_count} Python repositories and saved to {output_file}")
     return repos_info # Return the list for later use
 
 
-def batch_clone_repos(repos_info, clone_dir="ons_repos"):
+def _clone_one(repo: dict[str, Any], clone_dir: str) -> None:
+    """Clones a single repository into clone_dir, skipping it if already cloned."""
+    repo_name = repo["name"]
+    clone_url = repo["url"]
+    target_dir = os.path.join(clone_dir, repo_name)
+
+    if os.path.exists(target_dir):
+        print(f"Skipping {repo_name} (already cloned)")
+        return
+
+    print(f"Cloning {repo_name} from {clone_url} into {target_dir}...")
+    try:
+        # Only the latest source is needed, so skip the history and fetch blobs on checkout only
+        # A fixed argv without a shell; the URL comes from the GitHub API and git is found on PATH
+        result = subprocess.run(  # noqa: S603
+            ["git", "clone", "--depth=1", "--filter=blob:none", clone_url, target_dir],  # noqa: S607
+            check=False,
+            capture_output=True,
+            text=True,
+            timeout=CLONE_TIMEOUT,
+        )
+        if result.returncode != 0: #git returns a non-zero value on failure
+            print(f"Error cloning {repo_name}. Result Code {result.returncode}: {result.stderr.strip()}")
+    except subprocess.TimeoutExpired:
+        # git is killed mid-clone, so remove what it left or the next run would skip it as already cloned
+        shutil.rmtree(target_dir, ignore_errors=True)
+        print(f"Error cloning {repo_name}: timed out after {CLONE_TIMEOUT}s")
+    except Exception as e:
+        print(f"Error cloning {repo_name}: {e}")
+
+
+def batch_clone_repos(repos_info, clone_dir="ons_repos", max_workers=8):
     """
-    Batch clones the repositories listed in repos_info.
+    Batch clones the repositories listed in repos_info, several at a time.
 
     Args:
         repos_info: A list of dictionaries, each containing 'name' and 'url'
           keys for a repository.
         clone_dir: The directory to clone the repositories into.
+        max_workers: The maximum number of clones to run at once.
     """
 
     os.makedirs(clone_dir, exist_ok=True)  # Create the directory if it doesn't exist
 
-    for repo in repos_info:
-        repo_name = repo["name"]
-        clone_url = repo["url"]
-        target_dir = os.path.join(clone_dir, repo_name)
-
-        if os.path.exists(target_dir):
-            print(f"Skipping {repo_name} (already cloned)")
-            continue
-
-        print(f"Cloning {repo_name} from {clone_url} into {target_dir}...")
-        try:
-            # Use git clone command
-            result = os.system(f"git clone {clone_url} {target_dir}")
-            if result != 0: #git returns a non-zero value on failure
-                print(f"Error cloning {repo_name}. Result Code {result}")
-        except Exception as e:
-            print(f"Error cloning {repo_name}: {e}")
-
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(partial(_clone_one, clone_dir=clone_dir), repos_info))
 
 
 if __name__ == "__main__":